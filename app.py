@@ -1,120 +1,239 @@
 # app.py
-import os, re, json
-from datetime import datetime, date
-from typing import Optional, List, Dict
+import os, re, json, copy
+from datetime import date
+from typing import Optional, List, Dict, Iterator
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 
 from state_store import Store
 from tools import Tools, extract_order_id
-from web_agent import answer_with_web
-from prompts import SYSTEM_PROMPT, PLANNER_PROMPT, COMPOSER_PROMPT
+from web_agent import answer_with_web, answer_with_web_batch
+from prompts import SYSTEM_PROMPT, PLANNER_COMPOSER_PROMPT, COMPOSER_PROMPT, PLAN_RESPONSE_SCHEMA
+from llm_cache import LLMCache
+from rules import parse_iso_date
 import ui_loader as ui
 
 # ---- config / env ----
 DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 DEMO_FALLBACK_PHONE = os.getenv("DEMO_FALLBACK_PHONE", "9876543210")
 WEB_DEFAULT = os.getenv("WEB_ENABLED_DEFAULT", "1") == "1"
+TABLE_THRESHOLD, CARD_LIMIT = 20, 10  # order lists longer than this render cards only for the first CARD_LIMIT
+ORDER_TABLE_COLS = ("order_id","status","order_date","courier")
+EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
+LLM_SEMANTIC_CACHE = os.getenv("LLM_SEMANTIC_CACHE", "1") == "1"
+LLM_CACHE_DIR = os.path.join(".cache", "llm") if os.getenv("LLM_CACHE_DISK", "0") == "1" else None
+# planner web_queries searched per turn; the default 1 keeps DDGS volume at one search, 2+ share one batched summary call
+MAX_WEB_QUERIES = max(1, int(os.getenv("WEB_MAX_QUERIES", "1")))
 
-PHONE_10D_RE = re.compile(r"^\D*(\d\D*){10}$"); ORDER_ID_RE = re.compile(r"\bORD\d{5}\b", re.IGNORECASE)
+ORDER_ID_RE = re.compile(r"\bORD\d{5}\b", re.IGNORECASE)
+
+def _is_10_digit_phone(s: Optional[str]) -> bool: return bool(s) and sum(ch.isdigit() for ch in s) == 10
 
 # ---- OpenAI helpers ----
+_KEY_UNSET = object()
+
 def get_openai_key() -> Optional[str]:
-    try:
-        val = os.getenv("OPENAI_API_KEY", "").strip()
-        if not val and hasattr(st, "secrets"):
-            val = str(st.secrets.get("OPENAI_API_KEY", "")).strip()
-    except Exception: val = ""
-    return val if val.startswith("sk-") else None
+    """Resolved once per session (env first, then st.secrets); cleared by the sidebar "Verify" button."""
+    key = st.session_state.get("_resolved_openai_key", _KEY_UNSET)
+    if key is _KEY_UNSET:
+        try:
+            val = os.getenv("OPENAI_API_KEY", "").strip()
+            if not val and hasattr(st, "secrets"):
+                val = str(st.secrets.get("OPENAI_API_KEY", "")).strip()
+        except Exception: val = ""
+        key = st.session_state["_resolved_openai_key"] = val if val.startswith("sk-") else None
+    return key
+
+@st.cache_resource(show_spinner=False)
+def _openai_client_cached(key: str):
+    from openai import OpenAI
+    return OpenAI(api_key=key)  # one client (and httpx connection pool) per key, shared across reruns
 
 def _openai_client():
     try:
-        from openai import OpenAI
         key = get_openai_key()
-        return OpenAI(api_key=key) if key else None
+        return _openai_client_cached(key) if key else None
     except Exception: return None
 
+def _embed_text(text: str) -> Optional[List[float]]:
+    client = _openai_client()
+    if not client: return None
+    return client.embeddings.create(model=EMBED_MODEL, input=text).data[0].embedding
+
+@st.cache_resource(show_spinner=False)
+def _llm_cache() -> LLMCache:
+    return LLMCache(maxsize=512, disk_dir=LLM_CACHE_DIR, embed=_embed_text if LLM_SEMANTIC_CACHE else None)
+
+class _Uncacheable(Exception):
+    """Raised out of a st.cache_data function to hand back a result without caching it."""
+    def __init__(self, result): super().__init__("uncacheable result"); self.result = result
+
+# failed/empty web answers (DDGS rate limit, summary fallback) are returned but never cached
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def _web_answer_cached(query: str, depth: str, max_sources: int) -> Dict:
+    qa = answer_with_web(query, depth=depth, max_sources=max_sources)
+    if not qa.get("ok"): raise _Uncacheable(qa)
+    return qa
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def _web_answers_cached(queries: tuple, depth: str, max_sources: int) -> List[Dict]:
+    qas = answer_with_web_batch(list(queries), depth=depth, max_sources=max_sources)
+    if not all(qa.get("ok") for qa in qas): raise _Uncacheable(qas)
+    return qas
+
+def _web_answer(query: str, depth: str, max_sources: int) -> Dict:
+    try: return _web_answer_cached(query, depth, max_sources)
+    except _Uncacheable as e: return e.result
+
+def _web_answers(queries: tuple, depth: str, max_sources: int) -> List[Dict]:
+    try: return _web_answers_cached(queries, depth, max_sources)
+    except _Uncacheable as e: return e.result
+
 # ---- safety for "cancel" negations ----
-NEG_CANCEL_PATTERNS = [
-    r"\b(no need to\s+cancel)\b", r"\b(don'?t\s+cancel)\b", r"\b(do\s+not\s+cancel)\b",
-    r"\b(no\s+cancel)\b", r"\b(not\s+cancel)\b", r"\b(never\s+cancel)\b",
-    r"\b(keep\s+the\s+order)\b", r"\b(i\s+want\s+the\s+order)\b", r"\b(cancel\s+isn'?t\s+needed)\b",
-]
-def _neg_cancel(text: str) -> bool: return any(re.search(p, (text or "").lower()) for p in NEG_CANCEL_PATTERNS)
+NEG_CANCEL_PATTERNS = (
+    r"\bno need to\s+cancel\b", r"\bdon'?t\s+cancel\b", r"\bdo\s+not\s+cancel\b",
+    r"\bno\s+cancel\b", r"\bnot\s+cancel\b", r"\bnever\s+cancel\b",
+    r"\bkeep\s+the\s+order\b", r"\bi\s+want\s+the\s+order\b", r"\bcancel\s+isn'?t\s+needed\b",
+)
+_NEG_CANCEL_RE = re.compile("|".join(f"(?:{p})" for p in NEG_CANCEL_PATTERNS), re.IGNORECASE)
+def _neg_cancel(text: str) -> bool: return bool(_NEG_CANCEL_RE.search(text or ""))
+
+# intent keywords in priority order; each branch is an anchored lookahead so the first
+# matching branch wins regardless of where its keyword appears in the text
+_INTENT_BRANCHES = (  # (intent, pattern, word that must also appear somewhere or None)
+    ("keep_order", "|".join(f"(?:{p})" for p in NEG_CANCEL_PATTERNS), None),
+    ("track", r"where|status|track|eta", None),
+    ("cancel", r"cancel", None),
+    ("start_return", r"return", None),
+    ("refund_policy_or_status", r"refund", None),
+    ("change_address", r"address", None),
+    ("list_orders", r"orders", None),
+    ("delay_reason", r"so much time|so long|delay", None),
+    ("avg_time", r"average", r"time"),
+)
+# every lookahead is anchored at position 0, so each scan stays linear in the text length
+_INTENT_RE = re.compile("|".join(f"(?=.*?(?P<{name}>{alt}))" + (f"(?=.*?{also})" if also else "")
+                                 for name, alt, also in _INTENT_BRANCHES), re.IGNORECASE | re.S)
 
 def _fallback_intent(t: str) -> str:
-    tl = (t or "").lower()
-    if _neg_cancel(tl): return "keep_order"
-    if any(w in tl for w in ["where","status","track","eta"]): return "track"
-    if "cancel" in tl: return "cancel"
-    if "return" in tl and "status" not in tl: return "start_return"
-    if "refund" in tl: return "refund_policy_or_status"
-    if any(w in tl for w in ["address","change address","update address"]): return "change_address"
-    if any(w in tl for w in ["orders","my orders","recent orders","list my orders"]): return "list_orders"
-    if any(w in tl for w in ["so much time","so long","taking so long","delay","delayed"]): return "delay_reason"
-    if "average" in tl and "time" in tl: return "avg_time"
-    return "general_question"
-
-def ai_plan(user_text: str, active_oid: Optional[str], has_orders: bool) -> dict:
+    m = _INTENT_RE.match(t or "")
+    return m.lastgroup if m else "general_question"
+
+def _default_plan(user_text: str, active_oid: Optional[str], notes: str) -> dict:
+    return {"intent": _fallback_intent(user_text),"need_web": False,"target_order_id": active_oid,
+            "item_name": None,"address_text": None,"ask_clarify": False,"clarifying_question": None,
+            "actions": ["general_chat"],"web_queries": [],"notes": notes}
+
+ORDER_CTX_KEYS = ("order_id","status","est_delivery_date","courier","tracking_id","delivered_date",
+                  "return_eligible_until","address_line","items")
+
+def ai_plan(user_text: str, active_oid: Optional[str], has_orders: bool, neg_cancel: Optional[bool] = None,
+            active_order: Optional[dict] = None) -> dict:
     client = _openai_client()
-    if not client:
-        return {"intent": _fallback_intent(user_text),"need_web": False,"target_order_id": active_oid,
-                "item_name": None,"address_text": None,"ask_clarify": False,"clarifying_question": None,
-                "actions": ["general_chat"],"web_queries": [],"notes": "fallback"}
-    payload = {"user_text": user_text, "ACTIVE_ORDER_ID": active_oid or "", "HAS_ORDERS": has_orders}
+    if not client: return _default_plan(user_text, active_oid, "fallback")
+    payload = {"user_text": user_text, "ACTIVE_ORDER_ID": active_oid or "", "HAS_ORDERS": has_orders,
+               "ACTIVE_ORDER": {k: active_order.get(k) for k in ORDER_CTX_KEYS} if active_order else None}
+    messages = [{"role":"system","content": SYSTEM_PROMPT + "\n" + PLANNER_COMPOSER_PROMPT},{"role":"user","content": json.dumps(payload)}]
+    cache = _llm_cache()
     try:
-        resp = client.chat.completions.create(model=DEFAULT_MODEL, temperature=0.2,
-            messages=[{"role":"system","content": PLANNER_PROMPT},{"role":"user","content": json.dumps(payload)}])
-        raw = (resp.choices[0].message.content or "").strip()
-        start, end = raw.find("{"), raw.rfind("}")
-        plan = json.loads(raw[start:end+1]) if start!=-1 and end!=-1 and end>start else {}
-    except Exception: plan = {}
-    if _neg_cancel(user_text):
+        # exact-match only: plans carry extracted ids/addresses a near-duplicate hit would get wrong
+        raw = cache.get(DEFAULT_MODEL, messages, 0.2)
+        if raw is None:
+            resp = client.chat.completions.create(model=DEFAULT_MODEL, temperature=0.2, messages=messages,
+                response_format={"type": "json_schema",
+                                 "json_schema": {"name": "plan", "schema": PLAN_RESPONSE_SCHEMA, "strict": True}})
+            raw = resp.choices[0].message.content or ""; cache.set(DEFAULT_MODEL, messages, 0.2, raw)
+        out = json.loads(raw); plan = out["plan"]  # schema guarantees every plan field is present
+        if out.get("preliminary_answer"): plan["preliminary_answer"] = out["preliminary_answer"].strip()
+    except Exception: plan = _default_plan(user_text, active_oid, "ok")
+    if _neg_cancel(user_text) if neg_cancel is None else neg_cancel:
         plan["intent"] = "keep_order"; plan["actions"] = plan.get("actions") or []
         if "general_chat" not in plan["actions"]: plan["actions"].insert(0, "general_chat")
-    plan.setdefault("intent", _fallback_intent(user_text)); plan.setdefault("need_web", False)
-    plan.setdefault("target_order_id", active_oid); plan.setdefault("item_name", None)
-    plan.setdefault("address_text", None); plan.setdefault("ask_clarify", False)
-    plan.setdefault("clarifying_question", None); plan.setdefault("actions", ["general_chat"])
-    plan.setdefault("web_queries", []); plan.setdefault("notes", "ok")
     return plan
 
-def ai_compose(user_text: str, plan: dict, order_ctx: dict,
-               local_result: Optional[str], web_result: Optional[str], sources: List[Dict]) -> str:
+READ_ONLY_ACTIONS = {"set_active_from_text", "track_order"}
+
+def _needs_no_tools(plan: dict, web_enabled: bool, user_text: str, active_oid: Optional[str]) -> bool:
+    """True when the planner's draft answer can be sent as-is: pure chat, or tracking the ACTIVE_ORDER it was shown."""
+    free = {"general_chat"} if web_enabled else {"general_chat", "web_research"}
+    acts = set(plan.get("actions") or [])
+    if acts <= free: return True
+    on_active = bool(active_oid) and (plan.get("target_order_id") or active_oid)==active_oid \
+                and extract_order_id(user_text) in (None, active_oid)
+    return on_active and acts <= free | READ_ONLY_ACTIONS
+
+def _compose_fallback(plan: dict, local_result: Optional[str], web_result: Optional[str], src_lines: str) -> str:
+    parts = [x for x in [local_result, web_result] if x]
+    if plan.get("ask_clarify") and plan.get("clarifying_question"): parts.append(f"Quick question: {plan['clarifying_question']}")
+    if src_lines: parts.append("Sources:\n"+src_lines)
+    return "\n\n".join(parts) or "I’m here to help."
+
+def ai_compose_stream(user_text: str, plan: dict, order_ctx: dict,
+                      local_result: Optional[str], web_result: Optional[str], sources: List[Dict]) -> Iterator[str]:
+    """Yield the composed answer as it is generated (a single chunk on fallback or cache hit)."""
     client = _openai_client()
     src_lines = "\n".join(f"[{s['index']}] {s['title']} — {s['url']}" for s in (sources or []))
     if not client:
-        parts = [x for x in [local_result, web_result] if x]
-        if plan.get("ask_clarify") and plan.get("clarifying_question"): parts.append(f"Quick question: {plan['clarifying_question']}")
-        if src_lines: parts.append("Sources:\n"+src_lines)
-        return "\n\n".join(parts) or "I’m here to help."
+        yield _compose_fallback(plan, local_result, web_result, src_lines); return
     bundle = {"USER_TEXT": user_text,"PLAN": plan,"ORDER_CTX": order_ctx,"LOCAL_RESULT": local_result,
               "WEB_RESULT": web_result,"SOURCES_TEXT": src_lines}
+    messages = [{"role":"system","content": SYSTEM_PROMPT + "\n" + COMPOSER_PROMPT},
+                {"role":"user","content": json.dumps(bundle, ensure_ascii=False)}]
+    # near-duplicate USER_TEXT may reuse an answer only when everything else in the bundle matches
+    scope = json.dumps({k: v for k, v in bundle.items() if k != "USER_TEXT"}, sort_keys=True, ensure_ascii=False)
+    cache = _llm_cache(); parts: List[str] = []
     try:
-        resp = client.chat.completions.create(model=DEFAULT_MODEL, temperature=0.5,
-            messages=[{"role":"system","content": SYSTEM_PROMPT + "\n" + COMPOSER_PROMPT},
-                      {"role":"user","content": json.dumps(bundle, ensure_ascii=False)}])
-        return (resp.choices[0].message.content or "").strip()
+        answer = cache.get(DEFAULT_MODEL, messages, 0.5, user_text=user_text, scope=scope)
+        if answer is not None: yield answer; return
+        stream = client.chat.completions.create(model=DEFAULT_MODEL, temperature=0.5, messages=messages, stream=True)
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta: parts.append(delta); yield delta
+        cache.set(DEFAULT_MODEL, messages, 0.5, "".join(parts).strip(), user_text=user_text, scope=scope)
     except Exception:
-        parts = [x for x in [local_result, web_result] if x]
-        if plan.get("ask_clarify") and plan.get("clarifying_question"): parts.append(f"Quick question: {plan['clarifying_question']}")
-        if src_lines: parts.append("Sources:\n"+src_lines)
-        return "\n\n".join(parts) or "I’m here to help."
+        if not parts: yield _compose_fallback(plan, local_result, web_result, src_lines)
+
+SUMMARY_FALLBACK = "- Active order: not set\n- Intent: see Focus panel\n- Next: continue assisting."
+
+def summary_stream(client, transcript: str) -> Iterator[str]:
+    """Yield a 3-bullet conversation summary as it is generated; non-streaming retry, then a fixed note, on errors."""
+    if not client: yield SUMMARY_FALLBACK; return
+    kw = dict(model=DEFAULT_MODEL, temperature=0.2,
+              messages=[{"role":"system","content":"You are a concise operations note-taker."},
+                        {"role":"user","content": transcript + "\n\nSummarize the conversation in 3 bullets."}])
+    parts: List[str] = []
+    try:
+        for chunk in client.chat.completions.create(stream=True, **kw):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta: parts.append(delta); yield delta
+        if parts: return
+    except Exception:
+        if parts: return
+    try: yield (client.chat.completions.create(**kw).choices[0].message.content or "").strip() or SUMMARY_FALLBACK
+    except Exception: yield SUMMARY_FALLBACK
+
+@st.cache_resource(show_spinner=False)
+def _executor() -> ThreadPoolExecutor:
+    """Shared worker pool for slow calls kept off the script thread (workers can't touch st.session_state)."""
+    return ThreadPoolExecutor(max_workers=4)
+
+def _summary_job(client, transcript: str, buf: List[str]) -> str:
+    for piece in summary_stream(client, transcript): buf.append(piece)
+    return "".join(buf).strip() or SUMMARY_FALLBACK
 
 # ---- analytics helpers ----
-def _parse_date(d: Optional[str]): 
-    try: return datetime.fromisoformat(d).date() if d else None
-    except Exception: return None
+def _parse_date(d: Optional[str]): return parse_iso_date(d) if isinstance(d, str) else None
+
+def compute_avg_delivery_days_dual(store: Store, item: Optional[str]):
+    """((avg, n) for item, (avg, n) overall) from a single gather of the delivered days."""
+    return store.derived(("avg_delivery_days_dual", item), lambda: _avg_delivery_days_dual(store, item))
 
-def compute_avg_delivery_days(store: Store, item: Optional[str] = None, courier: Optional[str] = None):
-    days=[]; 
-    for o in store.orders.values():
-        if o.get("status")!="Delivered": continue
-        if item and item not in o.get("items", []): continue
-        if courier and courier != o.get("courier"): continue
-        ship=_parse_date(o.get("ship_date")); delivered=_parse_date(o.get("delivered_date"))
-        if ship and delivered and delivered>=ship: days.append((delivered-ship).days)
-    if not days: return None,0
-    return sum(days)/len(days), len(days)
+def _avg_delivery_days_dual(store: Store, item: Optional[str]):
+    soa=store.delivery_soa(); ok=soa["delivered_ok"]; days=soa["days"][ok]
+    overall=(float(days.mean()), int(days.size)) if days.size else (None,0)
+    if not item: return overall, overall
+    by_item=days[store.item_mask(item)[ok]]
+    return ((float(by_item.mean()), int(by_item.size)) if by_item.size else (None,0)), overall
 
 def explain_delay_for_order(order: dict, store: Store) -> str:
     if not order: return "I don’t see an active order. Please set one on the left or share its Order ID."
@@ -130,7 +249,7 @@ def explain_delay_for_order(order: dict, store: Store) -> str:
         if ship: msg.append(f"Days in transit so far: **{(today-ship).days}**.")
     elif status=="Delivered": msg.append("It has already been delivered.")
     item=(order.get("items") or [None])[0]
-    avg_item,n_item=compute_avg_delivery_days(store,item=item); overall,n_all=compute_avg_delivery_days(store)
+    (avg_item,n_item),(overall,n_all)=compute_avg_delivery_days_dual(store,item)
     if avg_item and n_item>=3: msg.append(f"Typical for **{item}**: ~**{avg_item:.1f} days** (n={n_item}).")
     elif overall: msg.append(f"Overall average: ~**{overall:.1f} days** (n={n_all}).")
     if status in {"Processing","Shipped","Out for Delivery"}:
@@ -138,6 +257,9 @@ def explain_delay_for_order(order: dict, store: Store) -> str:
     return " ".join(msg)
 
 def get_orders_for_session(store: Store, phone: Optional[str]):
+    return store.derived(("orders_for", phone), lambda: _orders_for(store, phone))
+
+def _orders_for(store: Store, phone: Optional[str]):
     try:
         if phone:
             hits=store.find_by_phone(phone)
@@ -146,26 +268,20 @@ def get_orders_for_session(store: Store, phone: Optional[str]):
     return store.find_by_phone(DEMO_FALLBACK_PHONE) or list(store.orders.values())
 
 # ====================== APP STATE & OVERLAY ======================
+_STATE_DEFAULTS = {
+    "processing": False, "messages": [], "active_oid": None, "active_item": None, "last_ctx": {},
+    "search_filter": {"mode":"none","value":None}, "search_q": "", "last_sources": [], "depth": "normal",
+    "max_sources": 4, "web_enabled": WEB_DEFAULT, "pending_action": None, "logged_in": False, "user_phone": None,
+    "summary_job": None, "turn_text": None,
+}
+
 def _init_state():
     st.set_page_config(page_title="OrderAi Copilot", page_icon="📦", layout="wide")
-    if "processing" not in st.session_state: st.session_state.processing=False
-    if "pending_user_text" not in st.session_state: st.session_state.pending_user_text=None
-    if "pending_already_logged" not in st.session_state: st.session_state.pending_already_logged=False
+    missing = _STATE_DEFAULTS.keys() - set(st.session_state.keys())
+    if missing: st.session_state.update({k: copy.copy(_STATE_DEFAULTS[k]) for k in missing})
+    # Store/Tools stay per session: orders are mutated by this user and wiped by "Reset Session"
     if "store" not in st.session_state: st.session_state.store=Store()
     if "tools" not in st.session_state: st.session_state.tools=Tools(st.session_state.store)
-    if "messages" not in st.session_state: st.session_state.messages=[]
-    if "active_oid" not in st.session_state: st.session_state.active_oid=None
-    if "active_item" not in st.session_state: st.session_state.active_item=None
-    if "last_ctx" not in st.session_state: st.session_state.last_ctx={}
-    if "search_filter" not in st.session_state: st.session_state.search_filter={"mode":"none","value":None}
-    if "search_q" not in st.session_state: st.session_state.search_q=""
-    if "last_sources" not in st.session_state: st.session_state.last_sources=[]
-    if "depth" not in st.session_state: st.session_state.depth="normal"
-    if "max_sources" not in st.session_state: st.session_state.max_sources=4
-    if "web_enabled" not in st.session_state: st.session_state.web_enabled=WEB_DEFAULT
-    if "pending_action" not in st.session_state: st.session_state.pending_action=None
-    if "logged_in" not in st.session_state: st.session_state.logged_in=False
-    if "user_phone" not in st.session_state: st.session_state.user_phone=None
 
 def _disabled() -> bool: return bool(st.session_state.get("processing", False))
 
@@ -179,7 +295,7 @@ def login_view():
         phone = st.text_input("Phone Number", placeholder="10-digit number")
         submitted = st.form_submit_button("Continue")
         if submitted:
-            if PHONE_10D_RE.match(phone or ""):
+            if _is_10_digit_phone(phone):
                 digits = "".join(ch for ch in phone if ch.isdigit())[-10:]
                 st.session_state.logged_in=True; st.session_state.user_phone=digits; st.rerun()
             else:
@@ -191,11 +307,7 @@ if "logged_in" not in st.session_state or not st.session_state.get("logged_in"):
 
 _init_state()
 ui.inject_css()
-ui.show_loading_overlay(
-    st.session_state.processing,
-    st.session_state.get("loading_title"),
-    st.session_state.get("loading_subtitle"),
-)
+overlay = st.empty()  # filled by _handle_turn while a message is being processed
 
 # HERO
 phone = st.session_state.user_phone or "9876543210"
@@ -214,6 +326,7 @@ with st.sidebar:
     st.caption(f"OpenAI: {'✅ Connected' if connected else '❌ Not set'}")
     st.caption(f"Model: {DEFAULT_MODEL}")
     if st.button("Verify OpenAI key now", disabled=_disabled()):
+        st.session_state.pop("_resolved_openai_key", None)  # re-read env/secrets before checking
         try:
             cli = _openai_client()
             if not cli: st.error("No usable key found (needs to start with 'sk-').")
@@ -225,6 +338,15 @@ with st.sidebar:
 store: Store = st.session_state.store
 tools: Tools = st.session_state.tools
 
+# resolved once per rerun and shared by every column below
+orders_now = get_orders_for_session(store, phone)
+active_now = store.get_order(st.session_state.active_oid) if st.session_state.active_oid else None
+
+def _order_for(oid: Optional[str]) -> Optional[dict]:
+    """active_now when oid is still the one it was resolved for, else a fresh lookup."""
+    if not oid: return None
+    return active_now if (active_now or {}).get("order_id") == oid else store.get_order(oid)
+
 col_left, col_mid, col_right = st.columns([0.30, 0.42, 0.28])
 
 # LEFT: Orders + Search
@@ -233,6 +355,14 @@ def _clear_search():
 def _reset_session():
     st.session_state.clear()
 
+def _order_table_rows(store: Store, oids: tuple) -> List[Dict]:
+    return store.derived(("order_table", oids), lambda: [
+        {k: store.orders[oid].get(k) for k in ORDER_TABLE_COLS} for oid in oids])
+
+def _select_table_row(oids: tuple):
+    rows = st.session_state.orders_table.selection.rows
+    if rows: st.session_state.active_oid = oids[rows[0]]; st.session_state.active_item = None
+
 with col_left:
     st.subheader("🛒 Your Orders")
     c1, c2 = st.columns(2)
@@ -245,9 +375,7 @@ with col_left:
         with st.container(border=True):
             st.caption("Suggestions")
             try:
-                s_ids = [o["order_id"] for o in (store.find_by_phone(phone) or []) if q.upper() in o["order_id"].upper()][:5]
-                if not s_ids:
-                    s_ids = [o["order_id"] for o in (get_orders_for_session(store, phone) or []) if q.upper() in o["order_id"].upper()][:5]
+                qu = q.upper(); s_ids = [o["order_id"] for o in orders_now if qu in o["order_id"].upper()][:5]
             except Exception: s_ids = []
             try:
                 s_items = tools.suggest_item_names(q, limit=5)
@@ -265,41 +393,47 @@ with col_left:
                 for i, it in enumerate(s_items):
                     with cols[i]:
                         if st.button(it, key=f"sug_item_{it}", disabled=_disabled()):
-                            my_orders=get_orders_for_session(store, phone)
-                            hits=[o for o in my_orders if it in o.get("items", [])] or [o for o in store.orders.values() if it in o.get("items", [])]
+                            mine={o["order_id"] for o in orders_now}
+                            with_item=store.orders_with_item(it)
+                            hits=[o for o in with_item if o["order_id"] in mine] or with_item
                             if hits: st.session_state.active_oid=hits[0]["order_id"]
                             st.session_state.active_item=it; st.session_state.search_filter={"mode":"item","value":it}; st.rerun()
 
     if st.button("Search", disabled=_disabled()):
-        if q and ORDER_ID_RE.search(q):
-            oid=ORDER_ID_RE.search(q).group(0).upper()
+        m_oid=ORDER_ID_RE.search(q) if q else None
+        if m_oid:
+            oid=m_oid.group(0).upper()
             if store.get_order(oid):
                 st.session_state.active_oid=oid; st.session_state.active_item=None
                 st.session_state.search_filter={"mode":"id","value":oid}; st.rerun()
             else: st.warning(f"No order found with ID {oid}.")
         elif q:
-            my_orders=get_orders_for_session(store, phone)
-            hits=[o for o in my_orders if any(q.lower() in it.lower() for it in o.get("items", []))] or store.search_by_item_keyword(q)
+            mine={o["order_id"] for o in orders_now}
+            kw_hits=store.search_by_item_keyword(q)
+            hits=[o for o in kw_hits if o["order_id"] in mine] or kw_hits
             if hits:
                 st.session_state.active_oid=hits[0]["order_id"]
-                best=next((it for it in hits[0].get("items", []) if q.lower() in it.lower()), None)
+                matched=set(store.match_item_names(q))  # index holds the pre-lowered names
+                best=next((it for it in hits[0].get("items", []) if it in matched), None)
                 st.session_state.active_item=best
                 st.session_state.search_filter={"mode":"item","value": (best or q)}; st.rerun()
             else:
                 st.session_state.active_item=None; st.session_state.search_filter={"mode":"none","value":None}; st.warning("No matching orders found.")
 
-    all_mine=get_orders_for_session(store, phone)
-    sf=st.session_state.search_filter
-    filtered=[o for o in all_mine if (sf["mode"]=="id" and sf["value"]==o["order_id"]) or
-                                   (sf["mode"]=="item" and sf["value"] in o.get("items", [])) or
-                                   (sf["mode"]=="none")]
+    all_mine=orders_now
+    mode, val = st.session_state.search_filter["mode"], st.session_state.search_filter["value"]
+    if mode=="none": filtered=all_mine
+    elif mode=="id": filtered=[o for o in all_mine if o["order_id"]==val]
+    else: filtered=[o for o in all_mine if val in o.get("items", ())]
     if not filtered:
         st.info("No orders to show.")
     else:
         status_filter = st.selectbox("Filter by status",
             ["All","Processing","Shipped","Out for Delivery","Delivered","Return Initiated","Refunded"], index=0, disabled=_disabled())
-        for o in filtered:
-            if status_filter!="All" and o.get("status")!=status_filter: continue
+        shown = filtered if status_filter=="All" else [o for o in filtered if o.get("status")==status_filter]
+        # long lists: full cards for the first few, one selectable table for the rest (~4 widgets instead of 4 per order)
+        cards, rest = (shown[:CARD_LIMIT], shown[CARD_LIMIT:]) if len(shown) > TABLE_THRESHOLD else (shown, [])
+        for o in cards:
             is_active = (o["order_id"] == st.session_state.active_oid)
             ui.render_order_card(o, highlight=is_active, focused_item=st.session_state.active_item)
             c1, c2 = st.columns(2)
@@ -310,60 +444,33 @@ with col_left:
                 its=o.get("items", [])
                 if its and st.button("Focus item", key=f"focus_{o['order_id']}", disabled=_disabled()):
                     st.session_state.active_oid=o['order_id']; st.session_state.active_item=its[0]; st.rerun()
+        if rest:
+            rest_oids = tuple(o["order_id"] for o in rest)
+            st.caption(f"{len(rest)} more orders — select a row to set it active.")
+            st.dataframe(_order_table_rows(store, rest_oids), hide_index=True, use_container_width=True,
+                         key="orders_table", selection_mode="single-row",
+                         on_select="ignore" if _disabled() else (lambda: _select_table_row(rest_oids)))
 
 # MIDDLE: Chat + Pending + Undo
-with col_mid:
-    st.subheader("🤖 Assistant")
-
-    la=store.last_action_info()
-    if la and la.get("can_undo"):
-        with st.container(border=True):
-            st.info(f"Recently performed: **{la['type']}** on **{la['oid']}**. You can **Undo** for another **{la['remaining_sec']}s**.")
-            if st.button("↩️ Undo last action", disabled=_disabled()):
-                ok,msg=store.undo_last(); st.session_state.messages.append({"role":"assistant","content": msg}); st.rerun()
-
-    for msg in st.session_state.messages:
-        with st.chat_message(msg["role"]): st.markdown(msg["content"])
-
-    if st.session_state.pending_action:
-        pa=st.session_state.pending_action
-        with st.container(border=True):
-            if pa["type"]=="cancel": st.warning(f"Confirm cancellation for **{pa['oid']}**?")
-            elif pa["type"]=="start_return": st.warning(f"Confirm starting a **return** for **{pa['oid']}**?")
-            elif pa["type"]=="change_address": st.warning(f"Confirm updating address for **{pa['oid']}** to:\n\n> {pa.get('address','(missing)')}")
-            c1,c2=st.columns(2)
-            with c1:
-                if st.button("✅ Confirm", disabled=_disabled()):
-                    if pa["type"]=="cancel": ok, result_msg=tools.cancel_order(pa["oid"])
-                    elif pa["type"]=="start_return": ok, result_msg=tools.start_return(pa["oid"])
-                    elif pa["type"]=="change_address": ok, result_msg=tools.change_address(pa["oid"], pa.get("address",""))
-                    else: ok, result_msg=False,"Unknown action."
-                    st.session_state.pending_action=None; st.session_state.messages.append({"role":"assistant","content": result_msg}); st.rerun()
-            with c2:
-                if st.button("❌ Dismiss", disabled=_disabled()):
-                    st.session_state.pending_action=None; st.session_state.messages.append({"role":"assistant","content":"Okay, I won’t proceed with that action."}); st.rerun()
-
-    typed = st.chat_input("Type your message...", disabled=_disabled())
-    if typed and not st.session_state.processing:
-        st.session_state.pending_user_text = typed
-        st.session_state.pending_already_logged = False
-        # Set the big centered loader text
-        st.session_state.loading_title = "RUNNING…"
-        st.session_state.loading_subtitle = "Thinking with OpenAI, searching the web, and updating your order context."
-        st.session_state.processing = True
-        st.rerun()
-
-
-    # Process while overlay is visible
-    if st.session_state.processing and st.session_state.pending_user_text:
-        user_text=st.session_state.pending_user_text
-        if not st.session_state.pending_already_logged:
-            st.session_state.messages.append({"role":"user","content": user_text})
-            st.session_state.pending_already_logged=True
-
-        active = store.get_order(st.session_state.active_oid) if st.session_state.active_oid else None
-        has_orders = len(get_orders_for_session(store, phone))>0
-        plan = ai_plan(user_text, (active or {}).get("order_id"), has_orders)
+def _submit_turn():
+    """chat_input callback: runs before the script, so the whole run that handles the turn draws widgets disabled."""
+    text = st.session_state.get("chat_in")
+    if text and not st.session_state.processing:
+        st.session_state.turn_text = text; st.session_state.processing = True
+
+def _handle_turn(user_text: str):
+    """Plan, run tools and compose the reply for one message; called last in the run, after every widget is drawn."""
+    st.session_state.messages.append({"role":"user","content": user_text})
+    with st.chat_message("user"): st.markdown(user_text)
+    try:
+        with overlay:
+            ui.show_loading_overlay(True, "RUNNING…", "Thinking with OpenAI, searching the web, and updating your order context.")
+        has_orders = len(orders_now)>0
+        neg_cancel = _neg_cancel(user_text)  # scanned once per turn, shared with the cancel_order guard
+        active_id = (active_now or {}).get("order_id")
+        plan = ai_plan(user_text, active_id, has_orders, neg_cancel=neg_cancel, active_order=active_now)
+        prelim = plan.pop("preliminary_answer", None)
+        direct = prelim if prelim and _needs_no_tools(plan, st.session_state.web_enabled, user_text, active_id) else None
 
         ctx={"intent": plan.get("intent")}
         oid = plan.get("target_order_id") or st.session_state.active_oid
@@ -374,6 +481,7 @@ with col_mid:
             if address: st.session_state.pending_action["address"]=address
 
         for act in (plan.get("actions") or []):
+            if direct and act not in READ_ONLY_ACTIONS: continue  # read-only lookups still fill ctx for the focus panel
             if act=="set_active_from_text":
                 maybe=extract_order_id(user_text)
                 if maybe and store.get_order(maybe): st.session_state.active_oid=maybe; oid=maybe
@@ -389,7 +497,7 @@ with col_mid:
                 else: extra=""
                 local_result=f"**{oid}** status: **{status}**.{extra}"
             elif act=="cancel_order":
-                if _neg_cancel(user_text): ctx["intent"]="keep_order"; local_result="Understood — I’ll keep your order as is. No cancellation."
+                if neg_cancel: ctx["intent"]="keep_order"; local_result="Understood — I’ll keep your order as is. No cancellation."
                 else:
                     if not oid: local_result="Which order should I cancel? (e.g., ORD10015)"
                     else:
@@ -412,7 +520,7 @@ with col_mid:
                         if order: ctx.update({"order":order,"oid":oid}); set_pending("change_address", oid, address=new_addr)
                         local_result=f"Please confirm: update **{oid}** address to:\n\n> {new_addr}\n\n(Use the buttons below.)"
             elif act=="list_orders":
-                hits=get_orders_for_session(store, phone) or []
+                hits=orders_now
                 if not hits: local_result=("I don’t see any orders on this login yet. If you placed orders with another number, tell me that number and I’ll look it up.")
                 else:
                     hits=sorted(hits, key=lambda o:o.get("order_date",""), reverse=True); top=hits[0]
@@ -427,16 +535,21 @@ with col_mid:
             elif act=="compute_avg":
                 order=tools.lookup_order(oid) if oid else None
                 item=(order.get("items") or [None])[0] if order else None
-                avg,n=compute_avg_delivery_days(store,item=item); 
-                if not avg: avg,n=compute_avg_delivery_days(store)
+                (avg,n),overall=compute_avg_delivery_days_dual(store,item)
+                if not avg: avg,n=overall
                 if avg:
                     ctx.update({"order":order,"oid":oid}); scope=f"for **{item}**" if item else "overall"
                     local_result=f"Average delivery time {scope} in your dataset is about **{avg:.1f} days** (n={n})."
             elif act=="web_research":
                 if st.session_state.web_enabled:
-                    qlist=plan.get("web_queries") or [user_text]
-                    qa=answer_with_web(qlist[0], depth=st.session_state.depth, max_sources=st.session_state.max_sources)
-                    web_result=qa["answer"]; sources=qa.get("sources", [])
+                    qlist=list(dict.fromkeys(q for q in (plan.get("web_queries") or []) if q))[:MAX_WEB_QUERIES] or [user_text]
+                    if len(qlist)==1:
+                        qa=_web_answer(qlist[0], st.session_state.depth, st.session_state.max_sources)
+                        web_result=qa["answer"]; sources=qa.get("sources", [])
+                    else:  # several planner queries: one batched summary call, answers merged in query order
+                        qas=_web_answers(tuple(qlist), st.session_state.depth, st.session_state.max_sources)
+                        web_result="\n\n".join(f"**{q}**: {qa['answer']}" for q,qa in zip(qlist,qas))
+                        sources=[{**s,"index":i} for i,s in enumerate((s for qa in qas for s in qa.get("sources",[])), start=1)]
                 else: web_result="Internet is disabled in the sidebar."
             elif act=="general_chat":
                 if not web_result:
@@ -451,32 +564,67 @@ with col_mid:
                             web_result="Hi! I’m here to help with your orders and questions."
                     else: web_result="Hi! I’m here to help with your orders and questions."
 
-        # Compose final
-        active_now = store.get_order(st.session_state.active_oid) if st.session_state.active_oid else None
-        order_ctx = {
-            "order_id": (ctx.get("oid") or (active_now or {}).get("order_id")),
-            "status": (ctx.get("order") or active_now or {}).get("status"),
-            "est_delivery_date": (ctx.get("order") or active_now or {}).get("est_delivery_date"),
-            "courier": (ctx.get("order") or active_now or {}).get("courier"),
-            "tracking_id": (ctx.get("order") or active_now or {}).get("tracking_id"),
-            "delivered_date": (ctx.get("order") or active_now or {}).get("delivered_date"),
-            "return_eligible_until": (ctx.get("order") or active_now or {}).get("return_eligible_until"),
-            "address_line": (ctx.get("order") or active_now or {}).get("address_line"),
-            "items": (ctx.get("order") or active_now or {}).get("items"),
-        }
-        final_answer = ai_compose(user_text, plan, order_ctx, local_result, web_result, sources)
-
-        audit=[f"Intent → {plan.get('intent')}", f"Need web → {plan.get('need_web')}",
-               f"Active OID → {st.session_state.active_oid}", f"Focused item → {st.session_state.active_item or '(none)'}",
-               f"Pending → {(st.session_state.pending_action or {}).get('type','(none)')}"]
-        final_answer += "\n\n—\n_Audit:_\n" + "\n".join(f"- {a}" for a in audit)
+        # Compose final (a lone general_chat reply is already a full answer; don't re-compose it)
+        if (not direct and plan.get("actions")==["general_chat"] and web_result
+                and not local_result and not sources and not plan.get("ask_clarify")):
+            direct = web_result
+        active = _order_for(st.session_state.active_oid)  # planner actions may have moved active_oid
+        src = ctx.get("order") or active or {}
+        order_ctx = {k: src.get(k) for k in ORDER_CTX_KEYS}
+        order_ctx["order_id"] = ctx.get("oid") or src.get("order_id")
+        overlay.empty()  # lift the loader so the answer is visible as it streams; widgets stay disabled
+        with st.chat_message("assistant"):
+            if direct: final_answer = direct; st.markdown(direct)
+            else: final_answer = str(st.write_stream(ai_compose_stream(user_text, plan, order_ctx, local_result, web_result, sources))).strip()
+
+        final_answer += (
+            f"\n\n—\n_Audit:_\n"
+            f"- Intent → {plan.get('intent')}\n"
+            f"- Need web → {plan.get('need_web')}\n"
+            f"- Active OID → {st.session_state.active_oid}\n"
+            f"- Focused item → {st.session_state.active_item or '(none)'}\n"
+            f"- Pending → {(st.session_state.pending_action or {}).get('type','(none)')}"
+        )
 
         st.session_state.messages.append({"role":"assistant","content": final_answer})
         st.session_state.last_ctx=ctx; st.session_state.last_sources=sources
+    finally:
+        st.session_state.processing = False
+    st.rerun()  # redraw sidebar, pending-action box and focus panel with the new state
+
+with col_mid:
+    st.subheader("🤖 Assistant")
 
-        # end processing
-        st.session_state.pending_user_text=None; st.session_state.pending_already_logged=False
-        st.session_state.processing=False; st.rerun()
+    la=store.last_action_info()
+    if la and la.get("can_undo"):
+        with st.container(border=True):
+            st.info(f"Recently performed: **{la['type']}** on **{la['oid']}**. You can **Undo** for another **{la['remaining_sec']}s**.")
+            if st.button("↩️ Undo last action", disabled=_disabled()):
+                ok,msg=store.undo_last(); st.session_state.messages.append({"role":"assistant","content": msg}); st.rerun()
+
+    for msg in st.session_state.messages:
+        with st.chat_message(msg["role"]): st.markdown(msg["content"])
+    turn_box = st.container()  # the submitted turn renders here at the end of the run
+
+    if st.session_state.pending_action:
+        pa=st.session_state.pending_action
+        with st.container(border=True):
+            if pa["type"]=="cancel": st.warning(f"Confirm cancellation for **{pa['oid']}**?")
+            elif pa["type"]=="start_return": st.warning(f"Confirm starting a **return** for **{pa['oid']}**?")
+            elif pa["type"]=="change_address": st.warning(f"Confirm updating address for **{pa['oid']}** to:\n\n> {pa.get('address','(missing)')}")
+            c1,c2=st.columns(2)
+            with c1:
+                if st.button("✅ Confirm", disabled=_disabled()):
+                    if pa["type"]=="cancel": ok, result_msg=tools.cancel_order(pa["oid"])
+                    elif pa["type"]=="start_return": ok, result_msg=tools.start_return(pa["oid"])
+                    elif pa["type"]=="change_address": ok, result_msg=tools.change_address(pa["oid"], pa.get("address",""))
+                    else: ok, result_msg=False,"Unknown action."
+                    st.session_state.pending_action=None; st.session_state.messages.append({"role":"assistant","content": result_msg}); st.rerun()
+            with c2:
+                if st.button("❌ Dismiss", disabled=_disabled()):
+                    st.session_state.pending_action=None; st.session_state.messages.append({"role":"assistant","content":"Okay, I won’t proceed with that action."}); st.rerun()
+
+    st.chat_input("Type your message...", key="chat_in", on_submit=_submit_turn, disabled=_disabled())
 
 # RIGHT: Focus / Order card / Summary / Sources
 def _render_focus_card(order: dict, highlight: bool = False, focused_item: Optional[str] = None):
@@ -489,35 +637,37 @@ with col_right:
     st.write(f"**Intent:** `{last_ctx.get('intent','(none)')}`")
     st.write("**Active Order:** `{}`".format(st.session_state.active_oid or "(none)"))
 
+    focus_order = _order_for(st.session_state.active_oid)
     if st.session_state.active_oid:
-        order=store.get_order(st.session_state.active_oid)
-        items=order.get("items", []) if order else []
+        items=focus_order.get("items", []) if focus_order else []
         if items:
             chosen=st.selectbox("Focus item (optional):", ["(none)"]+items, index=0, disabled=_disabled())
             st.session_state.active_item=None if chosen=="(none)" else chosen
 
     st.markdown("---")
     if st.session_state.active_oid:
-        _render_focus_card(store.get_order(st.session_state.active_oid), highlight=True, focused_item=st.session_state.active_item)
+        _render_focus_card(focus_order, highlight=True, focused_item=st.session_state.active_item)
     else:
         st.info("🚫 No order selected.")
 
     st.markdown("---")
     st.subheader("🧮 Summary")
-    if st.button("Generate short summary", disabled=_disabled()):
-        client=_openai_client()
-        if client:
-            try:
-                transcript="\n".join(f"{m['role']}: {m['content']}" for m in st.session_state.messages[-10:])
-                resp=client.chat.completions.create(model=DEFAULT_MODEL, temperature=0.2,
-                    messages=[{"role":"system","content":"You are a concise operations note-taker."},
-                              {"role":"user","content": transcript + "\n\nSummarize the conversation in 3 bullets."}])
-                summary=(resp.choices[0].message.content or "").strip()
-            except Exception:
-                summary="- Active order: not set\n- Intent: see Focus panel\n- Next: continue assisting."
-        else:
-            summary="- Active order: not set\n- Intent: see Focus panel\n- Next: continue assisting."
-        st.markdown(summary)
+    job=st.session_state.summary_job
+    running=bool(job) and not job["future"].done()
+    if st.button("Generate short summary", disabled=_disabled() or running):
+        transcript="\n".join(f"{m['role']}: {m['content']}" for m in st.session_state.messages[-10:])
+        buf: List[str]=[]  # filled by the worker; client and transcript are resolved here, on the script thread
+        st.session_state.summary_job={"future": _executor().submit(_summary_job, _openai_client(), transcript, buf), "buf": buf}
+        running=True
+    if st.session_state.summary_job:
+        @st.experimental_fragment(run_every=1 if running and not _disabled() else None)  # no polling reruns mid-turn
+        def _summary_panel():
+            job=st.session_state.summary_job
+            if job["future"].done():
+                if running: st.rerun()  # full rerun re-enables the button and stops polling
+                st.markdown(job["future"].result())
+            else: st.markdown("".join(job["buf"]) or "_Summarizing…_")
+        _summary_panel()
 
     st.markdown("---")
     st.subheader("🔗 Sources (last web answer)")
@@ -526,3 +676,7 @@ with col_right:
     if not (st.session_state.get("last_sources") or []):
         st.caption("No web sources yet.")
 
+# ---- submitted turn: handled last, once every widget above has been drawn disabled ----
+if st.session_state.turn_text:
+    _turn, st.session_state.turn_text = st.session_state.turn_text, None
+    with turn_box: _handle_turn(_turn)
@@ -1,8 +1,9 @@
 # data_seed.py
 import random
 random.seed(42)  # stable demo data
-from datetime import datetime, timedelta
+from datetime import datetime
 from dateutil.relativedelta import relativedelta
+import numpy as np
 
 CITIES = ["Delhi", "Mumbai", "Bengaluru", "Hyderabad", "Chennai", "Pune", "Kolkata", "Ahmedabad"]
 COURIERS = ["Bluedart", "Delhivery", "XpressBees", "Ecom Express", "Shadowfax"]
@@ -19,14 +20,6 @@ LOGIN_EMAIL = "demo@customer.com" # <- demo email
 def random_order_id(i: int) -> str:
     return f"ORD{10000 + i}"
 
-def rand_phone() -> str:
-    return "9" + "".join(str(random.randint(0,9)) for _ in range(9))
-
-def email_for(name: str) -> str:
-    base = name.lower()
-    domain = random.choice(["gmail.com","yahoo.com","outlook.com"])
-    return f"{base}{random.randint(10,99)}@{domain}"
-
 def seed_faqs() -> dict:
     return {
         "returns_window": "You can return most items within 10 days of delivery if unused and in original packaging.",
@@ -36,63 +29,103 @@ def seed_faqs() -> dict:
         "packaging": "Keep the original box, all accessories, and invoice for a smooth return."
     }
 
-def seed_orders(n: int = 260) -> dict:
-    today = datetime.now().date()
+PAYMENT_METHODS = ["UPI","Credit Card","Debit Card","COD"]
+EMAIL_DOMAINS = ["gmail.com","yahoo.com","outlook.com"]
+
+NUMBA_MIN_ORDERS = 50_000  # below this the per-order draws are cheap enough to skip the JIT entirely
+
+try:  # optional fast path for very large demo stores
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True)
+    def _gen_item_picks(n_items, n_vocab, seed):
+        """Row i: n_items[i] distinct indices into the item vocabulary (partial Fisher-Yates), -1 padded."""
+        np.random.seed(seed)
+        out = np.full((n_items.shape[0], 3), -1, np.int32); pool = np.arange(n_vocab)
+        for i in range(n_items.shape[0]):
+            for j in range(n_items[i]):
+                r = np.random.randint(j, n_vocab)
+                pool[j], pool[r] = pool[r], pool[j]; out[i, j] = pool[j]
+        return out
+
+    _gen_item_picks(np.ones(1, np.int64), 1, 0)  # compile (or load the on-disk cache) at import, not on the first big seed
+else:
+    _gen_item_picks = None
+
+def _iso(days) -> list:
+    """datetime64[D] array -> list of ISO date strings."""
+    return np.datetime_as_string(days, unit="D").tolist()
+
+def seed_orders(n: int = 260, seed: int = 42) -> dict:
+    today = np.datetime64(datetime.now().date(), "D")
     orders = {}
 
-    buckets = [
-        ("Processing", int(n * 0.20)),
-        ("Shipped", int(n * 0.27)),
-        ("Out for Delivery", int(n * 0.15)),
-        ("Delivered", int(n * 0.28)),
-        ("Return Initiated", int(n * 0.05)),
-        ("Refunded", n - sum([int(n * x) for x in [0.20,0.27,0.15,0.28,0.05]])),
-    ]
-
-    i = 0
-    for status, count in buckets:
-        for _ in range(count):
-            i += 1
-            order_id = random_order_id(i)
-            name = random.choice(FIRST)
-            phone = rand_phone()
-            email = email_for(name)
-            order_date = today - timedelta(days=random.randint(0, 45))
-            ship_date = None
-            est_delivery = None
-            delivered_date = None
-            if status != "Processing":
-                ship_date = order_date + timedelta(days=random.randint(0, 2))
-                est_delivery = ship_date + timedelta(days=random.randint(2, 6))
-            if status in {"Delivered","Return Initiated","Refunded"}:
-                delivered_date = order_date + timedelta(days=random.randint(4, 10))
-            return_eligible_until = (delivered_date + timedelta(days=10)) if delivered_date else None
-
-            # small, unique image per order using picsum (no signup needed)
-            image_url = f"https://picsum.photos/seed/{order_id}/100/100"
-
-            orders[order_id] = {
-                "order_id": order_id,
-                "customer_name": name,
-                "customer_email": email,
-                "customer_phone": phone,
-                "order_date": order_date.isoformat(),
-                "items": random.sample(ITEMS, k=random.randint(1, 3)),
-                "status": status,
-                "ship_date": ship_date.isoformat() if ship_date else None,
-                "est_delivery_date": est_delivery.isoformat() if est_delivery else None,
-                "delivered_date": delivered_date.isoformat() if delivered_date else None,
-                "courier": random.choice(COURIERS) if status != "Processing" else None,
-                "tracking_id": f"TRK{random.randint(100000,999999)}" if status != "Processing" else None,
-                "return_eligible_until": return_eligible_until.isoformat() if return_eligible_until else None,
-                "return_status": "Initiated" if status == "Return Initiated" else ("Not Started" if status in {"Delivered"} else None),
-                "refund_status": "Completed" if status == "Refunded" else ("Pending" if status == "Return Initiated" else None),
-                "payment_method": random.choice(["UPI","Credit Card","Debit Card","COD"]),
-                "address_city": random.choice(CITIES),
-                "address_line": f"{random.randint(1,200)} Main Road, {random.choice(CITIES)}",
-                "image_url": image_url,
-                "issues_history": [],
-            }
+    counts = [int(n * x) for x in [0.20,0.27,0.15,0.28,0.05]]
+    counts.append(n - sum(counts))  # Refunded takes the remainder
+    status = np.repeat(np.array(STATUSES, dtype=object), counts)
+
+    # every random column is drawn up front; only the dict assembly below is per order
+    rng = np.random.default_rng(seed)
+    order_d = today - rng.integers(0, 46, size=n)
+    ship_d = order_d + rng.integers(0, 3, size=n)
+    eta_d = ship_d + rng.integers(2, 7, size=n)
+    deliv_d = order_d + rng.integers(4, 11, size=n)
+    shipped = status != "Processing"
+    delivered = np.isin(status, ["Delivered","Return Initiated","Refunded"])
+
+    names = np.array(FIRST, dtype=object)[rng.integers(0, len(FIRST), size=n)].tolist()
+    phones = ["9%09d" % x for x in rng.integers(0, 10**9, size=n).tolist()]
+    email_no = rng.integers(10, 100, size=n).tolist()
+    domains = np.array(EMAIL_DOMAINS, dtype=object)[rng.integers(0, len(EMAIL_DOMAINS), size=n)].tolist()
+    couriers = np.array(COURIERS, dtype=object)[rng.integers(0, len(COURIERS), size=n)].tolist()
+    tracking = rng.integers(100000, 1000000, size=n).tolist()
+    payments = np.array(PAYMENT_METHODS, dtype=object)[rng.integers(0, len(PAYMENT_METHODS), size=n)].tolist()
+    cities = np.array(CITIES, dtype=object)[rng.integers(0, len(CITIES), size=(n, 2))].tolist()
+    house_no = rng.integers(1, 201, size=n).tolist()
+    n_items = rng.integers(1, 4, size=n)
+    if _gen_item_picks is not None and n >= NUMBA_MIN_ORDERS:
+        item_idx = _gen_item_picks(n_items, len(ITEMS), seed)  # distinct per row
+    else:
+        item_idx = rng.integers(0, len(ITEMS), size=(n, 3))  # with replacement; repeats are dropped below
+    item_rows = np.array(ITEMS, dtype=object)[item_idx].tolist()  # -1 padding falls past n_items and is sliced off
+    n_items = n_items.tolist()
+
+    order_iso, ship_iso, eta_iso = _iso(order_d), _iso(ship_d), _iso(eta_d)
+    deliv_iso, return_iso = _iso(deliv_d), _iso(deliv_d + 10)
+    shipped, delivered, status = shipped.tolist(), delivered.tolist(), status.tolist()
+
+    for i in range(n):
+        order_id = random_order_id(i + 1)
+        st_, name, was_shipped, was_delivered = status[i], names[i], shipped[i], delivered[i]
+
+        # small, unique image per order using picsum (no signup needed)
+        image_url = f"https://picsum.photos/seed/{order_id}/100/100"
+
+        orders[order_id] = {
+            "order_id": order_id,
+            "customer_name": name,
+            "customer_email": f"{name.lower()}{email_no[i]}@{domains[i]}",
+            "customer_phone": phones[i],
+            "order_date": order_iso[i],
+            "items": list(dict.fromkeys(item_rows[i][:n_items[i]])),
+            "status": st_,
+            "ship_date": ship_iso[i] if was_shipped else None,
+            "est_delivery_date": eta_iso[i] if was_shipped else None,
+            "delivered_date": deliv_iso[i] if was_delivered else None,
+            "courier": couriers[i] if was_shipped else None,
+            "tracking_id": f"TRK{tracking[i]}" if was_shipped else None,
+            "return_eligible_until": return_iso[i] if was_delivered else None,
+            "return_status": "Initiated" if st_ == "Return Initiated" else ("Not Started" if st_ in {"Delivered"} else None),
+            "refund_status": "Completed" if st_ == "Refunded" else ("Pending" if st_ == "Return Initiated" else None),
+            "payment_method": payments[i],
+            "address_city": cities[i][0],
+            "address_line": f"{house_no[i]} Main Road, {cities[i][1]}",
+            "image_url": image_url,
+            "issues_history": [],
+        }
 
     # Ensure the demo login phone has several orders
     ensure_demo_user_orders(orders, login_phone=LOGIN_PHONE, login_email=LOGIN_EMAIL, count=10)
@@ -0,0 +1,108 @@
+# llm_cache.py
+import os, json, pickle, hashlib, threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+def _normalize(vec: Optional[List[float]]) -> Optional[List[float]]:
+    if not vec: return None
+    norm = sum(x*x for x in vec) ** 0.5
+    return [x/norm for x in vec] if norm else None
+
+def _dot(a: List[float], b: List[float]) -> float: return sum(x*y for x, y in zip(a, b))
+
+class LLMCache:
+    """Bounded LRU of chat-completion texts.
+
+    Exact hits are keyed on sha256(model, messages, temperature) and only served for
+    near-deterministic calls (temperature <= max_exact_temperature). When an `embed`
+    callable is given, entries that share the same `scope` can also be served for a
+    near-duplicate `user_text` (cosine >= sim_threshold over the last `sim_window` entries);
+    texts are only embedded when such a same-scope entry exists.
+    """
+    def __init__(self, maxsize: int = 512, disk_dir: Optional[str] = None,
+                 embed: Optional[Callable[[str], Optional[List[float]]]] = None,
+                 sim_threshold: float = 0.92, sim_window: int = 64, max_exact_temperature: float = 0.3):
+        self.maxsize = maxsize; self.disk_dir = disk_dir; self.embed = embed
+        self.sim_threshold = sim_threshold; self.sim_window = sim_window
+        self.max_exact_temperature = max_exact_temperature
+        self._lru: "OrderedDict[str, Dict]" = OrderedDict()
+        self._vecs: "OrderedDict[str, Optional[List[float]]]" = OrderedDict()  # user_text -> unit vector
+        self._lock = threading.Lock()
+        if disk_dir: os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model: str, messages: List[Dict], temperature: float) -> str:
+        blob = json.dumps({"model": model, "messages": messages, "temperature": temperature}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    # ---- embeddings (each user_text is embedded at most once) ----
+    def _vector(self, user_text: Optional[str]) -> Optional[List[float]]:
+        if not (self.embed and user_text): return None
+        with self._lock:
+            if user_text in self._vecs: return self._vecs[user_text]
+        try: vec = _normalize(self.embed(user_text))
+        except Exception: vec = None
+        with self._lock:
+            self._vecs[user_text] = vec
+            while len(self._vecs) > self.sim_window: self._vecs.popitem(last=False)
+        return vec
+
+    # ---- disk ----
+    def _disk_path(self, k: str) -> str: return os.path.join(self.disk_dir, k + ".pkl")
+
+    def _disk_get(self, k: str) -> Optional[Dict]:
+        if not self.disk_dir: return None
+        try:
+            with open(self._disk_path(k), "rb") as f: return pickle.load(f)
+        except Exception: return None
+
+    def _disk_set(self, k: str, entry: Dict):
+        if not self.disk_dir: return
+        try:
+            with open(self._disk_path(k), "wb") as f: pickle.dump(entry, f)
+        except Exception: pass
+
+    # ---- public API ----
+    def get(self, model: str, messages: List[Dict], temperature: float,
+            user_text: Optional[str] = None, scope: Optional[str] = None) -> Optional[str]:
+        if temperature <= self.max_exact_temperature:
+            k = self.key(model, messages, temperature)
+            with self._lock:
+                hit = self._lru.get(k)
+                if hit: self._lru.move_to_end(k); return hit["content"]
+            hit = self._disk_get(k)
+            if hit:
+                with self._lock: self._lru[k] = hit
+                return hit["content"]
+        if scope is None or not (self.embed and user_text): return None
+        with self._lock:
+            recent = list(self._lru.items())[-self.sim_window:]
+            cands = [(k, e["user_text"]) for k, e in reversed(recent)
+                     if e.get("user_text") and e["model"] == model and e["scope"] == scope]
+        if not cands: return None  # nothing shares this scope: skip the embedding round trip
+        vec = self._vector(user_text)
+        if not vec: return None
+        best, best_k = self.sim_threshold, None
+        for k, text in cands:
+            cv = self._vector(text)
+            if cv:
+                s = _dot(vec, cv)
+                if s >= best: best, best_k = s, k
+        with self._lock:
+            if best_k is None or best_k not in self._lru: return None
+            self._lru.move_to_end(best_k); return self._lru[best_k]["content"]
+
+    def set(self, model: str, messages: List[Dict], temperature: float, content: str,
+            user_text: Optional[str] = None, scope: Optional[str] = None):
+        if not content: return
+        k = self.key(model, messages, temperature)
+        # user_text is embedded lazily, only once a later get() finds an entry with the same scope
+        entry = {"model": model, "scope": scope, "content": content,
+                 "user_text": user_text if scope is not None else None}
+        with self._lock:
+            self._lru[k] = entry; self._lru.move_to_end(k)
+            while len(self._lru) > self.maxsize: self._lru.popitem(last=False)
+        if temperature <= self.max_exact_temperature: self._disk_set(k, entry)
+
+    def clear(self):
+        with self._lock: self._lru.clear(); self._vecs.clear()
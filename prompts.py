@@ -54,3 +54,43 @@ Guidelines:
 5) End with a brief **Next steps** line with 2–3 suggested actions.
 Keep it under ~160 words unless user asked for details. Never claim an action executed unless LOCAL_RESULT indicates it completed.
 """
+
+PLANNER_COMPOSER_PROMPT = PLANNER_PROMPT + """
+Wrap the planner JSON and a draft reply in ONE object:
+{"plan": { ...planner JSON above... }, "preliminary_answer": "string | null"}
+
+- preliminary_answer is the final reply to the user, written per the composer guidelines below.
+- Fill it ONLY when plan.actions need no local order data or fetched web results (e.g. ["general_chat"]),
+  or when they only track ACTIVE_ORDER and the ACTIVE_ORDER fields given are enough to answer; otherwise null.
+
+""" + COMPOSER_PROMPT
+
+# Structured-output schema for PLANNER_COMPOSER_PROMPT (strict mode: every field required, nulls explicit)
+INTENTS = ["track", "cancel", "start_return", "refund_policy_or_status", "change_address", "list_orders",
+           "delay_reason", "avg_time", "general_question", "keep_order"]
+ACTIONS = ["set_active_from_text", "track_order", "cancel_order", "start_return", "change_address",
+           "list_orders", "explain_delay", "compute_avg", "general_chat", "web_research"]
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string", "enum": INTENTS},
+        "need_web": {"type": "boolean"},
+        "target_order_id": {"type": ["string", "null"]},
+        "item_name": {"type": ["string", "null"]},
+        "address_text": {"type": ["string", "null"]},
+        "ask_clarify": {"type": "boolean"},
+        "clarifying_question": {"type": ["string", "null"]},
+        "actions": {"type": "array", "items": {"type": "string", "enum": ACTIONS}},
+        "web_queries": {"type": "array", "items": {"type": "string"}},
+        "notes": {"type": "string"},
+    },
+    "required": ["intent", "need_web", "target_order_id", "item_name", "address_text", "ask_clarify",
+                 "clarifying_question", "actions", "web_queries", "notes"],
+    "additionalProperties": False,
+}
+PLAN_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {"plan": PLAN_SCHEMA, "preliminary_answer": {"type": ["string", "null"]}},
+    "required": ["plan", "preliminary_answer"],
+    "additionalProperties": False,
+}
@@ -1,5 +1,17 @@
 # rules.py
 from datetime import date, datetime
+from functools import lru_cache
+
+@lru_cache(maxsize=4096)
+def _parse_iso_cached(d: str) -> date | None:
+    try:
+        return datetime.fromisoformat(d).date()
+    except Exception:
+        return None
+
+def parse_iso_date(d: str | None) -> date | None:
+    """ISO string -> date (None if empty/invalid); parses are cached since order dates repeat every rerun."""
+    return _parse_iso_cached(d) if d else None
 
 def can_cancel(order: dict) -> bool:
     return order and order.get("status") == "Processing"
@@ -12,12 +24,8 @@ def is_return_eligible(order: dict, today: date | None = None) -> bool:
     due = order.get("return_eligible_until")
     if not due:
         return False
-    today = today or date.today()
-    try:
-        due_date = datetime.fromisoformat(due).date()
-        return today <= due_date
-    except Exception:
-        return False
+    due_date = parse_iso_date(due)
+    return due_date is not None and (today or date.today()) <= due_date
 
 def can_change_address(order: dict) -> bool:
     # Only allow before shipment (Processing)
@@ -1,8 +1,11 @@
 # state_store.py
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set
 from datetime import date, timedelta, datetime
-import copy, time, urllib.parse as _url
+from functools import lru_cache
+import time, urllib.parse as _url
+import numpy as np
 
+@lru_cache(maxsize=256)  # labels come from a small item vocabulary
 def _svg_data_uri(label: str) -> str:
     """Generate a pretty inline SVG with initials so images always render (no internet needed)."""
     text = (label or "Item").strip()
@@ -21,6 +24,14 @@ def _svg_data_uri(label: str) -> str:
     </svg>'''.strip()
     return "data:image/svg+xml;utf8," + _url.quote(svg)
 
+def _day64(d: Optional[str]) -> np.datetime64:
+    try: return np.datetime64(d[:10], "D") if d else np.datetime64("NaT")
+    except Exception: return np.datetime64("NaT")
+
+def _shallow_snapshot(o: Optional[Dict]) -> Optional[Dict]:
+    """Copy of an order dict; fields are str/None or list[str], so one level deep is a full copy."""
+    return {k: v[:] if isinstance(v, list) else v for k, v in o.items()} if o is not None else None
+
 def _image_for_items(items: List[str]) -> str:
     label = (items or ["Item"])[0]
     return _svg_data_uri(label)
@@ -47,8 +58,8 @@ def _make_order(oid: str, status: str, items: List[str], phone: str,
         "refund_status": refund_status,
     }
 
-def _seed_demo(phone: str = "9876543210") -> Dict[str, Dict]:
-    today = date.today()
+def _seed_demo(phone: str = "9876543210", today: Optional[date] = None) -> Dict[str, Dict]:
+    today = today or date.today()
     d: Dict[str, Dict] = {}
     d["ORD10071"] = _make_order("ORD10071","Delivered",["Wireless Earbuds"],phone,"BlueDart","BDX81234",
         (today- timedelta(days=7)).isoformat(), (today- timedelta(days=3)).isoformat(), (today- timedelta(days=3)).isoformat(),
@@ -74,28 +85,116 @@ def _seed_demo(phone: str = "9876543210") -> Dict[str, Dict]:
         (today- timedelta(days=1)).isoformat(), (today+ timedelta(days=3)).isoformat(), None,None,"Navi Mumbai",(today- timedelta(days=2)).isoformat())
     return d
 
+@lru_cache(maxsize=1)  # one template per day; keyed on the date so relative dates roll over
+def _seed_template(today: date, phone: str) -> Dict[str, Dict]:
+    return _seed_demo(phone, today)
+
 class Store:
     def __init__(self):
-        self.orders: Dict[str, Dict] = _seed_demo("9876543210")
+        # every session (and Reset Session) gets its own copy of the shared, read-only seed
+        self.orders: Dict[str, Dict] = {oid: _shallow_snapshot(o) for oid, o in _seed_template(date.today(), "9876543210").items()}
         self.actions: List[dict] = []
         self.last_action: Optional[dict] = None
         self._action_seq = 0
         self.undo_grace_seconds = 300
+        self.version = 0                  # bumped on every mutation
+        self._derived: Dict = {}          # values computed from orders, valid for the current version
+        self._build_item_index()
+        # phone -> order ids; no mutation below changes an order's phone, so this never needs invalidating
+        self._by_phone: Dict[str, List[str]] = {}
+        for oid, o in self.orders.items(): self._by_phone.setdefault(o.get("phone"), []).append(oid)
+
+    def _touch(self, oid: Optional[str] = None):
+        self.version += 1; self._derived.clear()
+        if oid: self._reindex_order(oid)
+
+    def derived(self, key, build):
+        """Return build() memoized until the next mutation."""
+        try: return self._derived[key]
+        except KeyError:
+            val = self._derived[key] = build(); return val
+
+    # struct-of-arrays view for vectorized analytics (rebuilt after each mutation)
+    def delivery_soa(self) -> Dict:
+        return self.derived("delivery_soa", self._build_delivery_soa)
+
+    def _build_delivery_soa(self) -> Dict:
+        orders = list(self.orders.values())
+        status = np.array([o.get("status") for o in orders], dtype=object)
+        ship = np.array([_day64(o.get("ship_date")) for o in orders], dtype="datetime64[D]")
+        delivered = np.array([_day64(o.get("delivered_date")) for o in orders], dtype="datetime64[D]")
+        valid = (status == "Delivered") & ~np.isnat(ship) & ~np.isnat(delivered) & (delivered >= ship)
+        days = np.where(valid, (delivered - ship).astype("timedelta64[D]").astype(np.int64), 0)
+        return {"delivered_ok": valid, "days": days,
+                "item_sets": [frozenset(o.get("items") or ()) for o in orders]}
+
+    def item_mask(self, item: str) -> np.ndarray:
+        def build():
+            sets = self.delivery_soa()["item_sets"]
+            return np.fromiter((item in s for s in sets), dtype=bool, count=len(sets))
+        return self.derived(("item_mask", item), build)
+
+    # item inverted index: exact name -> order ids, char trigram -> names.
+    # Built once in __init__ and patched per order by _reindex_order (mutations rarely touch items).
+    def _build_item_index(self):
+        self._oid_items: Dict[str, tuple] = {}      # oid -> distinct item names as indexed
+        self._name_oids: Dict[str, List[str]] = {}  # name -> oids, in store order
+        self._item_lower: Dict[str, str] = {}
+        self._item_grams: Dict[str, Set[str]] = {}
+        self._name_rank: Dict[str, int] = {}        # first-seen order of names
+        self._name_seq = 0
+        self._order_rank: Dict[str, int] = {}
+        for oid in self.orders: self._reindex_order(oid)
+
+    @staticmethod
+    def _grams(ln: str): return {ln[i:i+3] for i in range(len(ln) - 2)}
+
+    def _reindex_order(self, oid: str):
+        o = self.orders.get(oid)
+        old = self._oid_items.pop(oid, ()); new = tuple(dict.fromkeys((o or {}).get("items") or ()))
+        if o: self._oid_items[oid] = new; self._order_rank.setdefault(oid, len(self._order_rank))
+        if old == new: return
+        for name in old:
+            if name in new: continue
+            oids = self._name_oids[name]; oids.remove(oid)
+            if oids: continue
+            del self._name_oids[name]; del self._name_rank[name]
+            for g in self._grams(self._item_lower.pop(name)): self._item_grams[g].discard(name)
+        rank = self._order_rank.__getitem__
+        for name in new:
+            if name in old: continue
+            if name not in self._name_oids:
+                self._name_oids[name] = []; self._name_rank[name] = self._name_seq; self._name_seq += 1
+                ln = self._item_lower[name] = name.lower()
+                for g in self._grams(ln): self._item_grams.setdefault(g, set()).add(name)
+            oids = self._name_oids[name]; oids.append(oid)
+            if len(oids) > 1 and rank(oids[-2]) > rank(oid): oids.sort(key=rank)
+
+    def match_item_names(self, q: str) -> List[str]:
+        """Item names containing q (case-insensitive), in first-seen order."""
+        ql = (q or "").lower(); lower = self._item_lower
+        if len(ql) >= 3:
+            grams = self._item_grams
+            cands = set.intersection(*[grams.get(g, set()) for g in self._grams(ql)])
+        else: cands = lower.keys()
+        return sorted((n for n in cands if ql in lower[n]), key=self._name_rank.__getitem__)
+
+    def orders_with_item(self, name: str) -> List[Dict]:
+        return [self.orders[oid] for oid in self._name_oids.get(name, ())]
 
     def get_order(self, oid: str) -> Optional[Dict]: return self.orders.get(oid)
-    def find_by_phone(self, phone: str) -> List[Dict]: return [o for o in self.orders.values() if o.get("phone")==phone]
+    def find_by_phone(self, phone: str) -> List[Dict]: return [self.orders[oid] for oid in self._by_phone.get(phone, ())]
     def search_by_item_keyword(self, q: str) -> List[Dict]:
-        ql = (q or "").lower()
-        return [o for o in self.orders.values() if any(ql in it.lower() for it in o.get("items", []))]
+        oids = {oid for name in self.match_item_names(q) for oid in self._name_oids[name]}
+        return [self.orders[oid] for oid in sorted(oids, key=self._order_rank.__getitem__)]
 
     def snapshot_order(self, oid: str) -> Optional[Dict]:
-        o = self.get_order(oid); return copy.deepcopy(o) if o else None
+        o = self.get_order(oid); return _shallow_snapshot(o) if o else None
 
     def push_action(self, action_type: str, oid: str, before: Dict, after: Dict) -> dict:
-        import copy as _copy
         self._action_seq += 1
         entry = {"id": self._action_seq, "type": action_type, "oid": oid, "ts": time.time(),
-                 "before": _copy.deepcopy(before), "after": _copy.deepcopy(after)}
+                 "before": _shallow_snapshot(before), "after": _shallow_snapshot(after)}
         self.actions.append(entry); self.last_action = entry; return entry
 
     def can_undo(self) -> bool:
@@ -115,13 +214,13 @@ class Store:
         act = self.last_action; oid = act.get("oid"); before = act.get("before")
         if not before or not oid or oid not in self.orders:
             self.last_action = None; return False, "Nothing to undo."
-        self.orders[oid] = before; self.last_action = None
+        self.orders[oid] = before; self.last_action = None; self._touch(oid)
         return True, f"Reverted **{act.get('type','change')}** on **{oid}**."
 
     # mutations
     def set_status(self, oid: str, new_status: str):
-        if oid in self.orders: self.orders[oid]["status"] = new_status
+        if oid in self.orders: self.orders[oid]["status"] = new_status; self._touch(oid)
     def set_address(self, oid: str, new_addr: str):
-        if oid in self.orders: self.orders[oid]["address_line"] = new_addr
+        if oid in self.orders: self.orders[oid]["address_line"] = new_addr; self._touch(oid)
     def set_refund_status(self, oid: str, status: str):
-        if oid in self.orders: self.orders[oid]["refund_status"] = status
+        if oid in self.orders: self.orders[oid]["refund_status"] = status; self._touch(oid)
@@ -1,8 +1,9 @@
 # tools.py
 import re
-from typing import List, Tuple, Optional
-from datetime import date, datetime
+from typing import Dict, List, Tuple, Optional
+from datetime import date
 from state_store import Store
+from rules import parse_iso_date
 
 ORDER_ID_RE = re.compile(r"\bORD\d{5}\b", re.IGNORECASE)
 EMAIL_RE = re.compile(r"[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}", re.IGNORECASE)
@@ -20,6 +21,20 @@ def extract_phone(text: str) -> Optional[str]:
     m = PHONE_RE.search(text or "")
     return m.group(0) if m else None
 
+# one pass for all three; emails win overlaps, so digits/ids inside an address aren't reported twice
+ALL_RE = re.compile(r"(?P<email>%s)|(?P<order_id>%s)|(?P<phone>%s)" % (EMAIL_RE.pattern, ORDER_ID_RE.pattern, PHONE_RE.pattern),
+                    re.IGNORECASE)
+
+def extract_all(text: str) -> Dict[str, Optional[str]]:
+    """First order id, email and phone in text ({kind: None} when absent)."""
+    found: Dict[str, Optional[str]] = {"order_id": None, "email": None, "phone": None}
+    for m in ALL_RE.finditer(text or ""):
+        kind = m.lastgroup
+        if found[kind] is None:
+            found[kind] = m.group(0).upper() if kind == "order_id" else m.group(0)
+            if None not in found.values(): break
+    return found
+
 class Tools:
     def __init__(self, store: Store):
         self.store = store
@@ -35,14 +50,7 @@ class Tools:
         return [o["order_id"] for o in pool if q in o["order_id"].upper()][:limit]
 
     def suggest_item_names(self, q: str, limit: int = 10) -> List[str]:
-        ql = (q or "").lower()
-        seen = []
-        for o in self.store.orders.values():
-            for it in o.get("items", []):
-                if ql in it.lower() and it not in seen:
-                    seen.append(it)
-                    if len(seen) >= limit: return seen
-        return seen
+        return self.store.match_item_names(q)[:limit]
 
     # ops (with undo logging)
     def cancel_order(self, oid: str) -> Tuple[bool, str]:
@@ -66,10 +74,9 @@ class Tools:
         if not o: return False, f"I couldn't find {oid}."
         status = o.get("status"); ret_until = o.get("return_eligible_until")
         if status == "Delivered":
-            try:
-                if ret_until and date.today() > datetime.fromisoformat(ret_until).date():
-                    return False, f"Return window has expired for **{oid}**."
-            except Exception: pass
+            due = parse_iso_date(ret_until)  # unparseable windows don't block the return
+            if due and date.today() > due:
+                return False, f"Return window has expired for **{oid}**."
             before = self.store.snapshot_order(oid)
             self.store.set_status(oid, "Return Initiated")
             self.store.set_refund_status(oid, "Pending Pickup")
@@ -35,39 +35,47 @@ def render_hero(phone: str):
     phone_fmt = f"{phone[:3]}-{phone[3:6]}-{phone[6:]}" if phone and len(phone) == 10 else (phone or "—")
     st.markdown(tpl.format(phone_formatted=phone_fmt), unsafe_allow_html=True)
 
+_STATUS_CLASS = {
+    "processing": "status-processing", "shipped": "status-shipped", "out for delivery": "status-out",
+    "delivered": "status-delivered", "return initiated": "status-return", "refunded": "status-refunded",
+    "cancelled": "status-cancelled",
+}
+
+@lru_cache(maxsize=16)  # a handful of distinct statuses
 def status_pill_html(status: str) -> str:
-    s = (status or "").lower()
-    cls = "status-processing"
-    if s == "processing": cls = "status-processing"
-    elif s == "shipped": cls = "status-shipped"
-    elif s == "out for delivery": cls = "status-out"
-    elif s == "delivered": cls = "status-delivered"
-    elif s == "return initiated": cls = "status-return"
-    elif s == "refunded": cls = "status-refunded"
-    elif s == "cancelled": cls = "status-cancelled"
+    cls = _STATUS_CLASS.get((status or "").lower(), "status-processing")
     return f'<span class="status-pill {cls}">{status}</span>'
 
-def render_order_card(order: dict, highlight: bool = False, focused_item: str | None = None):
+CARD_FIELDS = ("image_url", "order_id", "status", "courier", "tracking_id", "est_delivery_date",
+               "ship_date", "delivered_date", "return_eligible_until", "address_line")
+
+@lru_cache(maxsize=1024)
+def _order_card_html(fields: tuple, items: tuple, highlight: bool) -> str:
+    """Card HTML for one combination of displayed values (reruns re-render identical cards)."""
     tpl = get_tpl("ORDER_CARD")
-    if not tpl:
+    o = dict(zip(CARD_FIELDS, fields))
+    return tpl.format(
+        image_url=o["image_url"] or "",
+        order_id=o["order_id"] or "—",
+        active_dot="🟢 " if highlight else "",
+        status_pill=status_pill_html(o["status"] or "—"),
+        items_list=", ".join(items),
+        courier=o["courier"] or "—",
+        tracking=o["tracking_id"] or "—",
+        eta=o["est_delivery_date"] or "—",
+        ship=o["ship_date"] or "—",
+        delivered=o["delivered_date"] or "—",
+        return_until=o["return_eligible_until"] or "—",
+        address=o["address_line"] or "—",
+    )
+
+def render_order_card(order: dict, highlight: bool = False, focused_item: str | None = None):
+    if not get_tpl("ORDER_CARD"):
         return
     items = order.get("items", []) or []
     if focused_item and focused_item in items:
         items = [f"**{it}**" if it == focused_item else it for it in items]
-    html = tpl.format(
-        image_url=order.get("image_url") or "",
-        order_id=order.get("order_id") or "—",
-        active_dot="🟢 " if highlight else "",
-        status_pill=status_pill_html(order.get("status") or "—"),
-        items_list=", ".join(items),
-        courier=order.get("courier") or "—",
-        tracking=order.get("tracking_id") or "—",
-        eta=order.get("est_delivery_date") or "—",
-        ship=order.get("ship_date") or "—",
-        delivered=order.get("delivered_date") or "—",
-        return_until=order.get("return_eligible_until") or "—",
-        address=order.get("address_line") or "—",
-    )
+    html = _order_card_html(tuple(order.get(k) for k in CARD_FIELDS), tuple(items), bool(highlight))
     st.markdown(html, unsafe_allow_html=True)
 
 def show_loading_overlay(is_on: bool, title: str | None = None, subtitle: str | None = None):
@@ -1,56 +1,130 @@
 # web_agent.py
+from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import time
-from typing import Dict, List
+from urllib.parse import urlparse
+import threading
 from duckduckgo_search import DDGS
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
+try:
+    import lxml  # noqa: F401  optional C parser, much faster than html.parser
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
 import html
+import json
 import re
 import os
 
+PER_HOST_CONCURRENCY = 2  # politeness: parallel fetches allowed against one site
+FETCH_TTL_SEC, FETCH_CACHE_MAX = 300, 256
+FETCH_MAX_BYTES = 512 * 1024  # pages are cut here; only the first paragraphs are used anyway
+SNIPPET_BUDGET = 800  # chars of each snippet sent to the model
+
+_SESSION = requests.Session()  # pooled TCP/TLS connections across fetches and queries
+_SESSION.headers.update({"User-Agent": "Mozilla/5.0"})
+for _scheme in ("http://", "https://"):
+    _SESSION.mount(_scheme, HTTPAdapter(pool_connections=8, pool_maxsize=16))  # keep-alive for parallel fetches
+_host_slots: Dict[str, threading.Semaphore] = {}
+_host_slots_lock = threading.Lock()
+
+def _host_slot(url: str) -> threading.Semaphore:
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        return _host_slots.setdefault(host, threading.Semaphore(PER_HOST_CONCURRENCY))
+
 def _clean_text(t: str) -> str:
     t = html.unescape(t or "")
     t = re.sub(r"\s+", " ", t).strip()
     return t
 
+_fetch_cache: Dict[str, Tuple[float, str]] = {}  # url -> (fetched_at, html); successful fetches only
+_fetch_cache_lock = threading.Lock()
+
 def _fetch(url: str, timeout=8) -> str:
+    now = time.time()
+    with _fetch_cache_lock:
+        hit = _fetch_cache.get(url)
+    if hit and now - hit[0] < FETCH_TTL_SEC:
+        return hit[1]
     try:
-        r = requests.get(url, timeout=timeout, headers={"User-Agent":"Mozilla/5.0"})
-        if r.status_code == 200 and "text" in r.headers.get("Content-Type",""):
-            return r.text
+        with _host_slot(url), _SESSION.get(url, timeout=timeout, stream=True) as r:
+            if r.status_code != 200 or "text" not in r.headers.get("Content-Type",""):
+                return ""
+            chunks, total = [], 0
+            for c in r.iter_content(65536):
+                chunks.append(c); total += len(c)
+                if total >= FETCH_MAX_BYTES: break
+            text = b"".join(chunks)[:FETCH_MAX_BYTES].decode(r.encoding or "utf-8", "ignore")
+        with _fetch_cache_lock:
+            if len(_fetch_cache) >= FETCH_CACHE_MAX:
+                _fetch_cache.pop(next(iter(_fetch_cache)))  # drop the oldest insert
+            _fetch_cache[url] = (now, text)
+        return text
     except Exception:
         pass
     return ""
 
-def _summarize_with_openai(query: str, snippets: List[Dict], depth: str = "normal") -> str:
+_P_ONLY = SoupStrainer("p")
+
+def _page_text(url: str, descr: str) -> str:
+    """Fetch a result page and keep its first paragraphs ("" when it can't be fetched)."""
+    html_doc = _fetch(url) if url else ""
+    if not html_doc:
+        return ""
+    try:
+        # only <p> elements are built into the tree; the rest of the page is skipped while parsing
+        soup = BeautifulSoup(html_doc, HTML_PARSER, parse_only=_P_ONLY)
+        paras = " ".join(_clean_text(p.get_text(" ", strip=True)) for p in soup.find_all("p", limit=8))
+        return (paras[:1200] + "...") if len(paras) > 1200 else paras
+    except Exception:
+        return descr
+
+def _compact_json(obj) -> str:
+    """Prompt payloads as minified JSON: fewer tokens than repr() or indented JSON."""
+    return json.dumps(obj, separators=(",",":"), ensure_ascii=False)
+
+@lru_cache(maxsize=4)
+def _openai_client(key: str):
+    from openai import OpenAI
+    return OpenAI(api_key=key)
+
+@lru_cache(maxsize=512)
+def _summarize_cached(query: str, snippets: Tuple[Tuple[str, str, str], ...], depth: str, key: str) -> str:
+    """One OpenAI summary per distinct (query, snippets, depth); errors propagate so they aren't cached."""
+    client = _openai_client(key)
+    system = "You concisely answer the user's question by synthesizing provided snippets. Include numeric facts only if present."
+    user_bundle = {
+        "question": query,
+        "snippets": [{"title": t, "url": u, "snippet": sn} for t, u, sn in snippets],
+        "style": depth
+    }
+    resp = client.chat.completions.create(
+        model=os.getenv("OPENAI_MODEL","gpt-4o-mini"),
+        messages=[{"role":"system","content":system},
+                  {"role":"user","content":_compact_json(user_bundle)}],
+        temperature=0.4,
+    )
+    return (resp.choices[0].message.content or "").strip()
+
+def _summarize_with_openai(query: str, snippets: List[Dict], depth: str = "normal") -> Tuple[str, bool]:
+    """(summary, ok); ok is False when a placeholder text is returned instead of a real summary."""
     try:
-        from openai import OpenAI
         key = os.getenv("OPENAI_API_KEY","")
         if not key or not key.startswith("sk-"):
             # fallback summary without OpenAI
             join = " • ".join(s.get("snippet","") for s in snippets[:3] if s.get("snippet"))
-            return f"{join or 'I could not summarize results.'}"
-        client = OpenAI(api_key=key)
-        system = "You concisely answer the user's question by synthesizing provided snippets. Include numeric facts only if present."
-        user_bundle = {
-            "question": query,
-            "snippets": snippets,
-            "style": depth
-        }
-        resp = client.chat.completions.create(
-            model=os.getenv("OPENAI_MODEL","gpt-4o-mini"),
-            messages=[{"role":"system","content":system},
-                      {"role":"user","content":str(user_bundle)}],
-            temperature=0.4,
-        )
-        return (resp.choices[0].message.content or "").strip()
+            return (join, True) if join else ("I could not summarize results.", False)
+        frozen = tuple((s.get("title",""), s.get("url",""), s.get("snippet","")[:SNIPPET_BUDGET]) for s in snippets)
+        return _summarize_cached(query, frozen, depth, key), True
     except Exception:
-        return "I tried, but couldn’t summarize results right now."
+        return "I tried, but couldn’t summarize results right now.", False
 
-def answer_with_web(query: str, depth: str = "normal", max_sources: int = 4) -> Dict:
-    """
-    Returns: {"answer": str, "sources":[{"index":1,"title":..., "url":...}, ...]}
-    """
+def _gather(query: str, max_sources: int) -> Tuple[List[Dict], List[Dict]]:
+    """Search one query and fetch its result pages; returns (snippets, sources)."""
     sources = []
     try:
         with DDGS() as ddgs:
@@ -58,26 +132,66 @@ def answer_with_web(query: str, depth: str = "normal", max_sources: int = 4) ->
     except Exception:
         results = []
 
+    picked = results[:max_sources]
+    rows = [(_clean_text(r.get("title","")), r.get("href") or r.get("url") or "", _clean_text(r.get("body","")))
+            for r in picked]
+    # fetch all sources concurrently: latency is the slowest page, not the sum of pages
+    with ThreadPoolExecutor(max_workers=max(1, len(rows))) as pool:
+        page_texts = list(pool.map(lambda row: _page_text(row[1], row[2]), rows))
+
     snippets = []
-    for i, r in enumerate(results[:max_sources], start=1):
-        title = _clean_text(r.get("title",""))
-        url = r.get("href") or r.get("url") or ""
-        descr = _clean_text(r.get("body",""))
-        page_text = ""
-        if url:
-            html_doc = _fetch(url)
-            if html_doc:
-                try:
-                    soup = BeautifulSoup(html_doc, "html.parser")
-                    paras = " ".join(_clean_text(p.get_text(" ", strip=True)) for p in soup.find_all("p")[:8])
-                    page_text = (paras[:1200] + "...") if len(paras) > 1200 else paras
-                except Exception:
-                    page_text = descr
+    for i, ((title, url, descr), page_text) in enumerate(zip(rows, page_texts), start=1):
         text_for_llm = page_text or descr
         if text_for_llm:
             snippets.append({"title": title, "url": url, "snippet": text_for_llm})
         sources.append({"index": i, "title": title or url, "url": url})
-        time.sleep(0.15)  # be gentle
+    return snippets, sources
 
-    answer = _summarize_with_openai(query, snippets, depth=depth)
-    return {"answer": answer, "sources": sources}
+def answer_with_web(query: str, depth: str = "normal", max_sources: int = 4) -> Dict:
+    """
+    Returns: {"answer": str, "sources":[{"index":1,"title":..., "url":...}, ...], "ok": bool}
+    ok is False when nothing usable came back (search failed, no snippets, or the summary
+    fell back to a placeholder); callers shouldn't cache those results.
+    """
+    snippets, sources = _gather(query, max_sources)
+    answer, ok = _summarize_with_openai(query, snippets, depth=depth)
+    return {"answer": answer, "sources": sources, "ok": ok and bool(snippets)}
+
+def _summarize_batch(items: List[Tuple[str, List[Dict]]], depth: str, key: str) -> Dict[int, str]:
+    """One OpenAI call for several (question, snippets); answers come back keyed by list index."""
+    client = _openai_client(key)
+    system = ("You concisely answer each question by synthesizing only its own snippets. Include numeric facts only if present. "
+              'Return a JSON object {"answers": [{"id": <id>, "answer": "..."}]} with one entry per question.')
+    user_bundle = {"style": depth,
+                   "questions": [{"id": i, "question": q,
+                                  "snippets": [{**x, "snippet": x.get("snippet","")[:SNIPPET_BUDGET]} for x in sn]}
+                                 for i, (q, sn) in enumerate(items)]}
+    resp = client.chat.completions.create(
+        model=os.getenv("OPENAI_MODEL","gpt-4o-mini"),
+        messages=[{"role":"system","content":system},
+                  {"role":"user","content":_compact_json(user_bundle)}],
+        temperature=0.4, response_format={"type": "json_object"},
+    )
+    out = json.loads(resp.choices[0].message.content or "{}")
+    return {int(a["id"]): str(a.get("answer") or "").strip() for a in out.get("answers", []) if "id" in a}
+
+def answer_with_web_batch(queries: List[str], depth: str = "normal", max_sources: int = 4) -> List[Dict]:
+    """
+    answer_with_web for several queries: searches/fetches run concurrently and the summaries
+    share ONE chat completion. Returns one {"answer", "sources", "ok"} dict per query, in order.
+    """
+    if len(queries) <= 1:
+        return [answer_with_web(q, depth=depth, max_sources=max_sources) for q in queries]
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        gathered = list(pool.map(lambda q: _gather(q, max_sources), queries))
+    key = os.getenv("OPENAI_API_KEY","")
+    answers: Dict[int, str] = {}
+    if key.startswith("sk-"):
+        try: answers = _summarize_batch([(q, sn) for q, (sn, _) in zip(queries, gathered)], depth, key)
+        except Exception: answers = {}
+    out = []
+    for i, (q, (sn, src)) in enumerate(zip(queries, gathered)):
+        # any question the batch didn't answer falls back to its own summary
+        answer, ok = (answers[i], True) if answers.get(i) else _summarize_with_openai(q, sn, depth=depth)
+        out.append({"answer": answer, "sources": src, "ok": ok and bool(sn)})
+    return out